@@ -0,0 +1,63 @@
+from cachetools import TTLCache
+import copy
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # redis is optional, the in-process cache works without it
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = 300
+# Entries younger than this are served without revalidating against racefacer
+FRESH_FOR = 60
+
+# Parsed profile results keyed by username, stored with the validators
+# (ETag / Last-Modified) needed to revalidate them against racefacer
+_local_cache = TTLCache(maxsize=1024, ttl=CACHE_TTL)
+
+REDIS_URL = os.environ.get("REDIS_URL")
+_redis = redis.from_url(REDIS_URL) if redis and REDIS_URL else None
+
+def _redis_key(username: str) -> str:
+    return f"race-data:{username}"
+
+def is_fresh(entry: Dict) -> bool:
+    """Whether an entry is recent enough to skip revalidation"""
+    return time.time() - entry.get("fetched_at", 0) < FRESH_FOR
+
+async def get_cached(username: str) -> Optional[Dict]:
+    """Return a copy of the cached entry for a user, checking the in-process cache first"""
+    entry = _local_cache.get(username)
+    if entry is not None or _redis is None:
+        # Hand out copies so callers can't mutate what later requests are served
+        return copy.deepcopy(entry)
+
+    try:
+        raw = await _redis.get(_redis_key(username))
+    except redis.RedisError as e:
+        logger.warning("Redis lookup failed: %s", e)
+        return None
+
+    if raw is None:
+        return None
+    entry = json.loads(raw)
+    _local_cache[username] = copy.deepcopy(entry)
+    return entry
+
+async def set_cached(username: str, entry: Dict) -> None:
+    """Store an entry in the in-process cache and, if configured, in Redis"""
+    entry = dict(entry, fetched_at=time.time())
+    _local_cache[username] = copy.deepcopy(entry)
+    if _redis is None:
+        return
+
+    try:
+        await _redis.set(_redis_key(username), json.dumps(entry), ex=CACHE_TTL)
+    except redis.RedisError as e:
+        logger.warning("Redis store failed: %s", e)
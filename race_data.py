@@ -1,127 +1,244 @@
-from fastapi import FastAPI, HTTPException
-import requests
-from bs4 import BeautifulSoup
-import json
+from fastapi import HTTPException
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from lxml import etree, html
 import logging
+import re
 import urllib.parse
 from typing import Dict, List, Optional
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('race_extractor.log'),
-        logging.StreamHandler()
-    ]
-)
+from cache import get_cached, is_fresh, set_cached
 
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Shared client so every request reuses pooled (and already TLS-negotiated) connections.
+# It is created on app startup and closed on shutdown, see open_client/close_client
+CLIENT: Optional[httpx.AsyncClient] = None
+_warm_up_task: Optional[asyncio.Task] = None
+
+def create_client() -> httpx.AsyncClient:
+    """Build the client used for every racefacer request"""
+    return httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+            retries=3,
+        ),
+        headers={
+            "User-Agent": "Mozilla/5.0 (compatible; racefacer-backend)",
+            "Accept": "text/html,application/xhtml+xml",
+            "Accept-Encoding": "br, gzip",
+        },
+        # Fail fast on an unreachable host instead of spending the whole budget connecting
+        timeout=httpx.Timeout(10.0, connect=3.0),
+        follow_redirects=True,
+    )
+
+async def warm_up_client() -> None:
+    """Open a pooled connection to racefacer so the first request skips the handshake"""
+    try:
+        await CLIENT.head("https://www.racefacer.com/", timeout=5)
+    except httpx.HTTPError as e:
+        logger.warning("HTTP client warm-up failed: %s", e)
+
+async def open_client() -> None:
+    """Create the shared client and warm it up in the background, without delaying startup"""
+    global CLIENT, _warm_up_task
+    CLIENT = create_client()
+    _warm_up_task = asyncio.create_task(warm_up_client())
+
+async def close_client() -> None:
+    """Close the shared client and its pooled connections"""
+    global CLIENT, _warm_up_task
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+        _warm_up_task = None
+    if CLIENT is not None:
+        await CLIENT.aclose()
+        CLIENT = None
+
+def has_class(name: str) -> str:
+    """XPath predicate matching elements whose class list contains name"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# XPath expressions compiled once at module load and shared by every request
+SESSION_CLASS = 'session-result-container'
+XP_USERNAME = etree.XPath(f"//*[{has_class('username')}]")
+XP_LOCATION = etree.XPath(f"//*[{has_class('profile-more-info')}]//span")
+XP_TOTAL_DISTANCE = etree.XPath(f"//*[{has_class('total_distance')}]//*[{has_class('value')}]")
+XP_TOTAL_TIME = etree.XPath(f"//*[{has_class('total_time')}]//*[{has_class('value')}]")
+XP_FAVORITE_TRACK = etree.XPath(f"//*[{has_class('favorite_track')}]//*[{has_class('value')}]")
+XP_POSITION = etree.XPath(f".//*[{has_class('top')}]//*[{has_class('position')} and {has_class('inline')}]")
+XP_DATE = etree.XPath(f".//*[{has_class('minified-stat')} and {has_class('date')}]//*[{has_class('date')}]")
+XP_CLOCK = etree.XPath(f".//*[{has_class('minified-stat')} and {has_class('date')}]//*[{has_class('clock')}]")
+XP_TRACK = etree.XPath(f".//*[{has_class('minified-stat')} and {has_class('track-kart')}]//*[{has_class('track-name')}]")
+XP_KART = etree.XPath(f"(.//*[{has_class('minified-stat')} and {has_class('track-kart')}]//div)[last()]")
+XP_BEST_TIME = etree.XPath(f".//*[{has_class('minified-stat')} and {has_class('time')}]//*[{has_class('minified-stat-value')}]")
+XP_LAP_ROWS = etree.XPath(f".//*[{has_class('tab_laps')}]//*[{has_class('table_content')}]//*[{has_class('row')}]")
+XP_LAP_NAME = etree.XPath(f".//*[{has_class('lap-name')}]")
+XP_LAP_TIME = etree.XPath(f".//*[{has_class('time_laps')} and {has_class('first')}]")
+PIT_RE = re.compile(r'pit', re.IGNORECASE)
+
+def first_match(xpath: etree.XPath, element):
+    """Return the first element matched by xpath, or None"""
+    matches = xpath(element)
+    return matches[0] if matches else None
+
+def first_text(xpath: etree.XPath, element) -> Optional[str]:
+    """Return the text of the first element matched by xpath, or None"""
+    match = first_match(xpath, element)
+    return match.text_content() if match is not None else None
 
 class RaceDataExtractor:
     def __init__(self, username: str):
         self.username = urllib.parse.quote(username)
         self.base_url = "https://www.racefacer.com/en/profile"
-        logger.info(f"Initialized RaceDataExtractor for user: {username}")
+        logger.info("Initialized RaceDataExtractor for user: %s", username)
 
     def extract_lap_times(self, session_container) -> List:
-        """Extract lap times from session container"""
+        """Extract lap times from session container, skipping pit laps"""
         lap_times = []
-        lap_rows = session_container.select('.tab_laps .table_content .row')
+        lap_rows = XP_LAP_ROWS(session_container)
         
         for row in lap_rows:
-            lap_name = row.select_one('.lap-name')
-            if not lap_name:
+            lap_name = first_match(XP_LAP_NAME, row)
+            if lap_name is None:
                 continue
                 
-            time_element = row.select_one('.time_laps.first')
-            if time_element:
-                time = time_element.get_text(strip=True)
-                lap_times.append([lap_name.text, time])
+            time_element = first_match(XP_LAP_TIME, row)
+            if time_element is not None and not PIT_RE.search(time_element.get('class', '')):
+                time = ''.join(t.strip() for t in time_element.itertext())
+                lap_times.append([lap_name.text_content(), time])
         
         return lap_times
 
-    def get_profile_data(self) -> Dict:
+    def extract_race(self, session_container) -> Dict:
+        """Extract a single race from its session container"""
+        return {
+            'race_id': session_container.get('data-session-uuid'),
+            'position': first_text(XP_POSITION, session_container).strip(),
+            'date': first_text(XP_DATE, session_container).strip(),
+            'time': "at " + first_text(XP_CLOCK, session_container).strip(),
+            'track': first_text(XP_TRACK, session_container).strip(),
+            'kart': first_text(XP_KART, session_container).strip(),
+            'lap_times': self.extract_lap_times(session_container),
+            'best_time': first_text(XP_BEST_TIME, session_container).strip()
+        }
+
+    def collect_races(self, parser, races_data: List) -> None:
+        """Extract every session container the pull parser has finished so far"""
+        for _, element in parser.read_events():
+            if SESSION_CLASS in element.get('class', '').split():
+                race = self.extract_race(element)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Extracted race %s with %s laps", race['race_id'], len(race['lap_times']))
+                races_data.append(race)
+                # The session is fully extracted, drop its subtree to bound memory
+                element.clear(keep_tail=True)
+
+    def create_parser(self, encoding: Optional[str]):
+        """Create the pull parser for a sessions page served in the given charset"""
+        parser = etree.HTMLPullParser(events=("end",), tag="div", encoding=encoding)
+        parser.set_element_class_lookup(html.HtmlElementClassLookup())
+        return parser
+
+    def feed_races(self, parser, chunk: bytes, races_data: List) -> None:
+        """Feed a chunk of the page to the pull parser and extract the sessions it completes"""
+        parser.feed(chunk)
+        self.collect_races(parser, races_data)
+
+    def finish_profile(self, parser, races_data: List) -> Optional[Dict]:
+        """Close the pull parser, extract any remaining sessions and the profile information"""
+        try:
+            tree = parser.close()
+        except etree.XMLSyntaxError:
+            # An empty or truncated body has no document; treat it as a missing profile
+            tree = None
+        self.collect_races(parser, races_data)
+
+        usernames = XP_USERNAME(tree) if tree is not None else []
+        if not usernames:
+            return None
+
+        return {
+            "Driver Name": usernames[0].text_content().strip(),
+            "Location": first_text(XP_LOCATION, tree).strip(', '),
+            "Statistics": {
+                "Total Distance": first_text(XP_TOTAL_DISTANCE, tree).strip(),
+                "Total Drive Hours": first_text(XP_TOTAL_TIME, tree).strip(),
+                "Preferred Track": first_text(XP_FAVORITE_TRACK, tree).strip()
+            }
+        }
+
+    async def get_profile_data(self) -> Dict:
         """Fetch and parse profile data"""
-        logger.info(f"Fetching data for user: {self.username}")
+        logger.info("Fetching data for user: %s", self.username)
         url = f"{self.base_url}/{self.username}/sessions"
         
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            cached = await get_cached(self.username)
+            if cached and is_fresh(cached):
+                logger.info("Serving fresh cached data for user: %s", self.username)
+                return cached["data"]
 
-            if not soup.select_one('.username'):
-                logger.error("Profile not found")
-                raise HTTPException(status_code=404, detail="Profile not found")
-
-            # Extract profile information
-            profile_info = {
-                "Driver Name": soup.select_one('.username').text.strip(),
-                "Location": soup.select_one('.profile-more-info span').text.strip(', '),
-                "Statistics": {
-                    "Total Distance": soup.select_one('.total_distance .value').text.strip(),
-                    "Total Drive Hours": soup.select_one('.total_time .value').text.strip(),
-                    "Preferred Track": soup.select_one('.favorite_track .value').text.strip()
-                }
-            }
+            headers = {}
+            if cached:
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
 
-            # Extract races data
             races_data = []
-            session_containers = soup.select('.session-result-container')
-            
-            for container in session_containers:
-                race = {
-                    'race_id': container['data-session-uuid'],
-                    'position': container.select_one('.top .position.inline').text.strip(),
-                    'date': container.select_one('.minified-stat.date .date').text.strip(),
-                    'time': "at " + container.select_one('.minified-stat.date .clock').text.strip(),
-                    'track': container.select_one('.minified-stat.track-kart .track-name').text.strip(),
-                    'kart': container.select('.minified-stat.track-kart div')[-1].text.strip(),
-                    'lap_times': self.extract_lap_times(container),
-                    'best_time': container.select_one('.minified-stat.time .minified-stat-value').text.strip()
-                }
-                races_data.append(race)
+            loop = asyncio.get_running_loop()
+            # Parsing is CPU-bound, so it runs off the event loop. lxml trees must not move
+            # between threads, so one worker thread creates the parser and runs every call on it
+            executor = ThreadPoolExecutor(max_workers=1)
+
+            try:
+                async with CLIENT.stream("GET", url, headers=headers) as response:
+                    if cached and response.status_code == 304:
+                        logger.info("Profile unchanged, serving cached data for user: %s", self.username)
+                        await set_cached(self.username, cached)
+                        return cached["data"]
+                    response.raise_for_status()
+
+                    # Bytes are fed as they arrive, so the parser needs the charset from the headers
+                    parser = await loop.run_in_executor(executor, self.create_parser, response.charset_encoding)
+
+                    # Parse while the body downloads, extracting each session as soon as it is complete
+                    async for chunk in response.aiter_bytes():
+                        await loop.run_in_executor(executor, self.feed_races, parser, chunk, races_data)
+
+                profile_info = await loop.run_in_executor(executor, self.finish_profile, parser, races_data)
+            finally:
+                executor.shutdown(wait=False)
+
+            if profile_info is None:
+                logger.error("Profile not found")
+                raise HTTPException(status_code=404, detail="Profile not found")
 
             # Add total races count
             profile_info["Total Races"] = len(races_data)
 
-            return {
+            result = {
                 "profile_info": profile_info,
                 "races_data": races_data
             }
 
-        except requests.RequestException as e:
-            logger.error(f"Request failed: {str(e)}")
+            await set_cached(self.username, {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "data": result
+            })
+
+            return result
+
+        except HTTPException:
+            raise
+        except httpx.HTTPError as e:
+            logger.error("Request failed: %s", e)
             raise HTTPException(status_code=500, detail=f"Failed to fetch data: {str(e)}")
         except Exception as e:
-            logger.error(f"Error processing data: {str(e)}")
+            logger.error("Error processing data: %s", e)
             raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
-
-@app.get("/race-data/{username}")
-async def get_race_data(username: str):
-    """API endpoint to get race data for a specific user"""
-    logger.info(f"Received request for user: {username}")
-    
-    try:
-        extractor = RaceDataExtractor(username)
-        data = extractor.get_profile_data()
-        logger.info(f"Successfully processed data for user: {username}")
-        return data
-    
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        logger.error(f"Error processing request for user {username}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"}
-
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)